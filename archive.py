@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tarfile
+import zipfile
+import posixpath
+from collections import Counter
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+archives = {} # Archives whose index has been loaded, keyed by the path of the archive
+
+def is_archive(path):
+    """ Checks whether a path is a tar (optionally compressed) or zip archive rather than a dataset directory """
+    return os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+def archive_kind(path):
+    """ Returns 'tar' for an uncompressed tar archive, whose members can be read in place, 'zip' or 'compressed-tar'.
+        Tar is checked first, as a tar holding a zip file (such as a .npz) near its end can look like a zip archive """
+    try:
+        with tarfile.open(path, 'r:'):
+            return 'tar'
+    except tarfile.ReadError:
+        return 'zip' if zipfile.is_zipfile(path) else 'compressed-tar'
+
+def scan_archive(path):
+    """ Lists the regular file members of an archive as (name, offset, size), where the topic of a member is the name of the folder containing it.
+        The offset is where the data of a tar member starts, or where the header of a zip member starts """
+    if archive_kind(path) == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            members = [(info.filename, info.header_offset, info.file_size) for info in archive.infolist() if not info.is_dir()]
+    else:
+        with tarfile.open(path) as archive:
+            members = [(member.name, member.offset_data, member.size) for member in archive if member.isfile()]
+    members = [member for member in members if posixpath.dirname(member[0]) and not member_topic(member[0]).startswith('.') and not posixpath.basename(member[0]).startswith('.')]
+    return sorted(members, key=lambda member: (member_topic(member[0]), member[0]))
+
+def member_topic(name):
+    """ Returns the topic of an archive member, which is the name of the folder containing it """
+    return posixpath.basename(posixpath.dirname(name))
+
+def build_archive_index(path):
+    """ Builds the index of an archive with the same arrays as a dataset directory index, plus the offset and size of each member """
+    members = scan_archive(path)
+    topics = sorted(set(member_topic(name) for name, offset, size in members))
+    topic_sizes = Counter(member_topic(name) for name, offset, size in members)
+    stat = os.stat(path)
+    return {'topics': np.array(topics, dtype=str),
+            'filenames': np.array([name for name, offset, size in members], dtype=str),
+            'offsets': np.cumsum([0] + [topic_sizes[topic] for topic in topics]),
+            'member_offsets': np.array([offset for name, offset, size in members], dtype=np.int64),
+            'sizes': np.array([size for name, offset, size in members], dtype=np.int64),
+            'mtimes': np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)}
+
+def archive_is_current(path, index):
+    """ Checks that an archive has not been modified since its index was built """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return 'member_offsets' in index and [stat.st_mtime_ns, stat.st_size] == index['mtimes'].tolist()
+
+class ArchiveCorpus():
+    """ Reads the members of an indexed archive, seeking straight to their data where the archive is not compressed """
+
+    def __init__(self, path, index):
+        self.path = path
+        self.kind = archive_kind(path)
+        self.members = {name: (offset, size) for name, offset, size in zip(index['filenames'].tolist(), index['member_offsets'].tolist(), index['sizes'].tolist())}
+        self.fd = os.open(path, os.O_RDONLY) if self.kind == 'tar' else None
+        self.zip = zipfile.ZipFile(path) if self.kind == 'zip' else None
+
+    def size(self, name):
+        """ Returns the size in bytes of a member """
+        return self.members[name][1]
+
+    def read(self, name):
+        """ Reads a single member. Members of a compressed tar can only be reached by decompressing the archive up to them """
+        if self.kind == 'tar':
+            offset, size = self.members[name]
+            return os.pread(self.fd, size, offset)
+        if self.kind == 'zip': return self.zip.read(name)
+        with tarfile.open(self.path) as archive:
+            return archive.extractfile(name).read()
+
+    def iter_members(self, names):
+        """ Reads the members of a compressed tar in a single pass over the archive, yielding (name, bytes) in archive order """
+        wanted = set(names)
+        with tarfile.open(self.path, 'r|*') as archive:
+            for member in archive:
+                if member.name in wanted:
+                    yield member.name, archive.extractfile(member).read()
+                    wanted.remove(member.name)
+                    if not wanted: return
+
+def register_archive(path, index):
+    """ Makes the members of an indexed archive readable through their filepaths """
+    if path not in archives or archives[path].members.keys() != set(index['filenames'].tolist()):
+        archives[path] = ArchiveCorpus(path, index)
+
+def find_archive(filepath):
+    """ Returns the archive containing a filepath (document) and the name of its member, or (None, None) for a regular file """
+    for path, archive in archives.items():
+        if filepath.startswith(path + '/'): return archive, filepath[len(path) + 1:]
+    return None, None
+
+def in_compressed_tar(filepath):
+    """ Checks whether a filepath (document) is a member of a compressed tar, which can only be reached by decompressing the archive from its start """
+    archive, name = find_archive(filepath)
+    return archive is not None and archive.kind == 'compressed-tar'
+
+def document_size(filepath):
+    """ Returns the size in bytes of a filepath (document), whether it is a regular file or an archive member """
+    archive, name = find_archive(filepath)
+    return archive.size(name) if archive is not None else os.path.getsize(filepath)
+
+def read_document(filepath):
+    """ Reads the bytes of a filepath (document), whether it is a regular file or an archive member """
+    archive, name = find_archive(filepath)
+    if archive is not None: return archive.read(name)
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+def iter_documents(filepaths, num_threads=8):
+    """ Reads many filepaths (documents), yielding (position, bytes) pairs. Documents in a compressed tar are read in a single pass
+        in archive order, everything else is read by a bounded pool of threads in the order given """
+    compressed = {}
+    for position, filepath in enumerate(filepaths):
+        archive, name = find_archive(filepath)
+        if archive is not None and archive.kind == 'compressed-tar': compressed.setdefault(archive, {}).setdefault(name, []).append(position)
+    if not compressed:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            yield from enumerate(executor.map(read_document, filepaths))
+        return
+    for archive, positions in compressed.items():
+        for name, document in archive.iter_members(positions.keys()):
+            for position in positions[name]: yield position, document
+    read = set(position for positions in compressed.values() for member_positions in positions.values() for position in member_positions)
+    regular = [position for position in range(len(filepaths)) if position not in read]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        yield from zip(regular, executor.map(read_document, [filepaths[position] for position in regular]))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import csv
+import shutil
+import itertools
+import multiprocessing
+from contextlib import redirect_stdout
+from optparse import OptionParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from corpus_index import load_corpus_index
+from materialize import OUTPUT_MODES, supports_output_mode
+from stream import load_generators
+from vectorize import load_vectors
+
+GRID_PARAMETERS = {'shift': ['k', 'window_size', 'min_topics', 'shift_prob'],
+                   'drift': ['k', 'window_size', 'decrease_windows', 'increase_windows', 'min_topics', 'drift_prob']}
+
+def parse_values(values, value_type):
+    """ Parses a comma separated list of values, where integer ranges can be given as start-end (inclusive) """
+    parsed = []
+    for value in values.split(','):
+        if value_type is int and '-' in value.strip('-'):
+            start, end = value.split('-')
+            parsed.extend(range(int(start), int(end) + 1))
+        else:
+            parsed.append(value_type(value))
+    return parsed
+
+def expand_grid(generator, grid, seeds, output_path):
+    """ Creates one job for every combination of grid values and seed, each with its own output folder """
+    names = GRID_PARAMETERS[generator]
+    jobs = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        for seed in seeds:
+            job = dict(zip(names, values), generator=generator, seed=seed)
+            folder = '-'.join([generator] + ['%s%s' % (name, value) for name, value in zip(names, values)] + ['seed%s' % seed])
+            job['output_path'] = os.path.join(output_path, folder)
+            jobs.append(job)
+    return jobs
+
+def run_job(job, input_path, output_mode, cache_dir, vectorize=False):
+    """ Generates and saves the dataset for a single job, returning the job and the number of time windows generated """
+    ConceptShift, ConceptDrift = load_generators()
+    partial_path = job['output_path'] + '.partial' # Renamed once the job has finished, so that an interrupted job is run again rather than skipped
+    if os.path.exists(partial_path): shutil.rmtree(partial_path)
+    log = io.StringIO()
+    with redirect_stdout(log):
+        if job['generator'] == 'shift':
+            gen = ConceptShift(input_path, job['k'], job['window_size'], job['min_topics'], job['shift_prob'], partial_path, output_mode, 1, cache_dir, job['seed'], vectorize=vectorize)
+        else:
+            gen = ConceptDrift(input_path, job['k'], job['window_size'], job['decrease_windows'], job['increase_windows'], job['min_topics'], job['drift_prob'], partial_path, output_mode, 1, cache_dir, job['seed'], vectorize=vectorize)
+        for cur_window in gen.iter_windows(): pass
+        gen.save_dataset()
+        gen.write_csv()
+    with open(os.path.join(partial_path, 'generation.log'), 'w') as f:
+        f.write(log.getvalue())
+    os.rename(partial_path, job['output_path'])
+    return job, len(gen.time_windows)
+
+def run_batch(jobs, input_path, output_mode='copy', processes=None, cache_dir=None, vectorize=False):
+    """ Runs the jobs across a pool of processes which share the corpus index (and term counts) loaded here. Jobs whose output folder already exists are skipped.
+        Returns the finished jobs, a job which fails is reported and left out """
+    load_corpus_index(input_path, cache_dir) # Loaded once, forked workers inherit it
+    if vectorize: load_vectors(input_path, cache_dir)
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    pending = [job for job in jobs if not os.path.exists(job['output_path'])]
+    if len(pending) < len(jobs): print('Skipping %d jobs whose output already exists.' % (len(jobs) - len(pending)))
+    results = []
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = {executor.submit(run_job, job, input_path, output_mode, cache_dir, vectorize): job for job in pending}
+        for future in as_completed(futures):
+            try:
+                job, num_windows = future.result()
+            except Exception as e: # One failing job, e.g. k larger than the number of topics, must not lose the jobs which finished
+                print('Failed %s (%s: %s)' % (os.path.basename(futures[future]['output_path']), type(e).__name__, e))
+                continue
+            print('Finished %s (%d windows)' % (os.path.basename(job['output_path']), num_windows))
+            results.append((job, num_windows))
+    return results
+
+def write_summary(output_path, generator, results):
+    """ Writes the parameters, seed, output folder and number of windows of every finished job to batch.csv """
+    names = GRID_PARAMETERS[generator] + ['seed', 'output_path']
+    with open(os.path.join(output_path, 'batch.csv'), 'a', newline='') as f:
+        writer = csv.writer(f)
+        if f.tell() == 0: writer.writerow(names + ['num_windows'])
+        for job, num_windows in sorted(results, key=lambda result: result[0]['output_path']):
+            writer.writerow([job[name] for name in names] + [num_windows])
+
+#-----------------------------------------------------------------------------------------------------
+def main():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("--generator", action="store", type="choice", choices=['shift', 'drift'], dest="generator", help="generator to run: shift or drift", default="shift")
+    parser.add_option("--input", action="store", type="string", dest="input_path", help="filepath to folder containing dataset")
+    parser.add_option("-k", action="store", type="string", dest="k", help="comma separated numbers of starting topics", default="5")
+    parser.add_option("--window_size", action="store", type="string", dest="window_size", help="comma separated numbers of documents in a window", default="100")
+    parser.add_option("--decrease_windows", action="store", type="string", dest="decrease_windows", help="comma separated numbers of windows for a topic to be gradually removed", default="10")
+    parser.add_option("--increase_windows", action="store", type="string", dest="increase_windows", help="comma separated numbers of windows for a topic to be gradually introduced", default="15")
+    parser.add_option("--min_topics", action="store", type="string", dest="min_topics", help="comma separated minimum numbers of topics before ending", default="3")
+    parser.add_option("--shift_prob", action="store", type="string", dest="shift_prob", help="comma separated probabilities of a concept shift occuring", default="0.05")
+    parser.add_option("--drift_prob", action="store", type="string", dest="drift_prob", help="comma separated probabilities of a concept drift occuring", default="0.05")
+    parser.add_option("--seeds", action="store", type="string", dest="seeds", help="comma separated seeds or ranges of seeds, e.g. 0-99", default="0")
+    parser.add_option("--processes", action="store", type="int", dest="processes", help="number of worker processes (default: one per CPU)", default=None)
+    parser.add_option("--output", action="store", type="string", dest="output_path", help="folder in which a dataset folder is created for each job", default=None)
+    parser.add_option("--output_mode", action="store", type="choice", choices=OUTPUT_MODES, dest="output_mode", help="how documents are stored: %s" % ", ".join(OUTPUT_MODES), default="copy")
+    parser.add_option("--cache_dir", action="store", type="string", dest="cache_dir", help="folder where the corpus index is cached instead of inside the input folder", default=None)
+    parser.add_option("--vectors", action="store_true", dest="vectors", help="also save the term counts of each time window as a sparse matrix, from a cached tokenization of the corpus", default=False)
+    (options, args) = parser.parse_args()
+
+    if not supports_output_mode(options.input_path, options.output_mode):
+        print('Documents inside an archive cannot be stored with output mode "%s". EXITING.' % options.output_mode)
+        sys.exit(1)
+    value_types = {'k': int, 'window_size': int, 'decrease_windows': int, 'increase_windows': int, 'min_topics': int, 'shift_prob': float, 'drift_prob': float}
+    grid = {name: parse_values(getattr(options, name), value_types[name]) for name in GRID_PARAMETERS[options.generator]}
+    jobs = expand_grid(options.generator, grid, parse_values(options.seeds, int), options.output_path)
+    if not os.path.exists(options.output_path): os.makedirs(options.output_path)
+
+    print("Generating %d datasets..." % len(jobs))
+    results = run_batch(jobs, options.input_path, options.output_mode, options.processes, options.cache_dir, options.vectors)
+    write_summary(options.output_path, options.generator, results)
+    failed = [job for job in jobs if not os.path.exists(job['output_path'])]
+    print("Finished, %d jobs failed." % len(failed) if failed else "Finished.")
+
+#-----------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tarfile
+import platform
+import numpy as np
+from contextlib import redirect_stdout
+from optparse import OptionParser
+import corpus_index
+from materialize import OUTPUT_MODES
+from stream import load_generators
+from checkpoint import run_generation
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'goal', 'puck', 'sale', 'price', 'circuit', 'voltage', 'team', 'game', 'space', 'orbit', 'engine', 'driver']
+
+def build_corpus(path, num_topics, num_docs, doc_size, seed=0):
+    """ Builds a synthetic corpus of num_docs documents spread unevenly over num_topics topic folders, unless it already exists """
+    marker = os.path.join(path, '.complete')
+    if os.path.exists(marker): return
+    if os.path.exists(path): shutil.rmtree(path)
+    rng = np.random.RandomState(seed)
+    topic_sizes = rng.multinomial(num_docs, rng.dirichlet(np.ones(num_topics) * 5))
+    words = np.array(WORDS)
+    for topic_num, topic_size in enumerate(topic_sizes):
+        topic_dir = os.path.join(path, 'topic-%04d' % topic_num)
+        os.makedirs(topic_dir)
+        for doc_num in range(topic_size):
+            with open(os.path.join(topic_dir, '%07d' % doc_num), 'w') as f:
+                f.write(' '.join(words[rng.randint(len(words), size=doc_size // 6)]))
+    open(marker, 'w').close()
+
+def build_archive(path, kind):
+    """ Archives a synthetic corpus as an uncompressed or gzip compressed tar next to it, unless it already exists, and returns the path of the archive """
+    archive_path = '%s.%s' % (path, kind)
+    if os.path.exists(archive_path): return archive_path
+    with tarfile.open(archive_path + '.tmp', 'w:gz' if kind == 'tar.gz' else 'w') as archive:
+        for topic in sorted(os.listdir(path)):
+            if not topic.startswith('.'): archive.add(os.path.join(path, topic), arcname=os.path.join(os.path.basename(path), topic))
+    os.replace(archive_path + '.tmp', archive_path)
+    return archive_path
+
+def clear_index(input_path):
+    """ Removes the cached and in-process corpus index so that the next run indexes the corpus from scratch """
+    path = corpus_index.index_path(input_path)
+    if os.path.exists(path): os.remove(path)
+    corpus_index.loaded_indexes.clear()
+
+def create_generator(generator, input_path, output_path, options, num_topics):
+    """ Creates a ConceptShift or ConceptDrift generator with the benchmark parameters, starting with a quarter of the topics unless -k is given """
+    ConceptShift, ConceptDrift = load_generators()
+    k = options.num_topics or max(options.min_topics, num_topics // 4)
+    if generator == 'shift':
+        return ConceptShift(input_path, k, options.window_size, options.min_topics, 0.05, output_path, options.output_mode, options.num_threads, None, options.seed)
+    return ConceptDrift(input_path, k, options.window_size, 5, 10, options.min_topics, 0.05, output_path, options.output_mode, options.num_threads, None, options.seed)
+
+def timed(phases, name, function, *args):
+    """ Runs a function, recording how many seconds it took under name """
+    start = time.perf_counter()
+    result = function(*args)
+    phases[name] = time.perf_counter() - start
+    return result
+
+def run_benchmark(generator, input_path, output_path, options, num_topics):
+    """ Times one end to end run of a generator, phase by phase, sampling and saving the windows with run_generation as the generators do """
+    phases = {}
+    if os.path.exists(output_path): shutil.rmtree(output_path) # Left over from an interrupted run, the generators refuse to overwrite it
+    with redirect_stdout(io.StringIO()):
+        clear_index(input_path)
+        timed(phases, 'index', create_generator, generator, input_path, output_path, options, num_topics)
+        corpus_index.loaded_indexes.clear()
+        gen = timed(phases, 'index_warm', create_generator, generator, input_path, output_path, options, num_topics)
+        gen.prepare_output()
+        run_generation(gen)
+        phases['sample'], phases['save'] = gen.stats.phases['sample'], gen.stats.phases['save']
+        timed(phases, 'overview', gen.write_csv)
+        if generator == 'shift':
+            import matplotlib.pyplot as plt
+            timed(phases, 'plot', gen.plot_dataset)
+            plt.close('all')
+    shutil.rmtree(output_path)
+    total = sum(seconds for name, seconds in phases.items() if name != 'index')
+    return {'generator': generator, 'windows': len(gen.time_windows), 'documents_sampled': sum(len(cur_window) for cur_window in gen.time_windows), 'phases': phases, 'total': total}
+
+def compare_results(results, previous):
+    """ Prints the ratio of each phase time to the matching result of a previous benchmark run """
+    keys = ('generator', 'topics', 'documents', 'output_mode', 'archive')
+    previous = {tuple(result.get(key, 'none') for key in keys): result for result in previous} # Results from before archives were benchmarked read from a folder
+    for result in results:
+        before = previous.get(tuple(result.get(key, 'none') for key in keys))
+        if before is None: continue
+        ratios = ', '.join('%s %.2fx' % (name, seconds / before['phases'][name]) for name, seconds in result['phases'].items() if before['phases'].get(name))
+        print('%s %d topics, %d documents: %.3fs -> %.3fs (%s)' % (result['generator'], result['topics'], result['documents'], before['total'], result['total'], ratios))
+
+#-----------------------------------------------------------------------------------------------------
+def main():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("--topics", action="store", type="string", dest="topics", help="comma separated numbers of topics in the synthetic corpora", default="20,100")
+    parser.add_option("--documents", action="store", type="string", dest="documents", help="comma separated numbers of documents in the synthetic corpora", default="10000,100000")
+    parser.add_option("--doc_size", action="store", type="int", dest="doc_size", help="approximate size of each synthetic document in bytes", default=1000)
+    parser.add_option("--generators", action="store", type="string", dest="generators", help="comma separated generators to benchmark: shift, drift", default="shift,drift")
+    parser.add_option("-k", action="store", type="int", dest="num_topics", help="number of starting topics (default: a quarter of the topics)", default=None)
+    parser.add_option("--window_size", action="store", type="int", dest="window_size", help="number of documents in a window", default=100)
+    parser.add_option("--min_topics", action="store", type="int", dest="min_topics", help="minimum topics before ending", default=3)
+    parser.add_option("--output_mode", action="store", type="choice", choices=OUTPUT_MODES, dest="output_mode", help="how documents are stored: %s" % ", ".join(OUTPUT_MODES), default="copy")
+    parser.add_option("--threads", action="store", type="int", dest="num_threads", help="number of threads used to copy or link documents", default=8)
+    parser.add_option("--archive", action="store", type="choice", choices=['none', 'tar', 'tar.gz'], dest="archive", help="read the synthetic corpora from an archived copy: none, tar or tar.gz", default="none")
+    parser.add_option("--seed", action="store", type="int", dest="seed", help="seed for the corpora and the generators", default=0)
+    parser.add_option("--workdir", action="store", type="string", dest="workdir", help="folder where the synthetic corpora and outputs are created", default="benchmark-data")
+    parser.add_option("--results", action="store", type="string", dest="results", help="json file the results are written to", default="benchmark-results.json")
+    parser.add_option("--compare", action="store", type="string", dest="compare", help="json file of a previous run to compare the results against", default=None)
+    (options, args) = parser.parse_args()
+
+    load_generators() # Imported up front so that the import is not timed as part of the first run
+    results = []
+    for num_topics in [int(value) for value in options.topics.split(',')]:
+        for num_docs in [int(value) for value in options.documents.split(',')]:
+            input_path = os.path.join(options.workdir, 'corpus-%d-%d-%d' % (num_topics, num_docs, options.doc_size))
+            print("Building corpus with %d topics and %d documents..." % (num_topics, num_docs))
+            build_corpus(input_path, num_topics, num_docs, options.doc_size, options.seed)
+            if options.archive != 'none': input_path = build_archive(input_path, options.archive)
+            for generator in options.generators.split(','):
+                result = run_benchmark(generator, input_path, os.path.join(options.workdir, 'output'), options, num_topics)
+                result.update({'topics': num_topics, 'documents': num_docs, 'doc_size': options.doc_size, 'output_mode': options.output_mode, 'archive': options.archive, 'window_size': options.window_size})
+                print("%s: %d windows in %.3fs (%s)" % (generator, result['windows'], result['total'], ', '.join('%s %.3fs' % phase for phase in result['phases'].items())))
+                results.append(result)
+
+    with open(options.results, 'w') as f:
+        json.dump({'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            compare_results(results, json.load(f)['results'])
+    print("Finished.")
+
+#-----------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+	main()
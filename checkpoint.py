@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pickle
+import shutil
+import numpy as np
+from archive import in_compressed_tar
+from materialize import MANIFEST_NAME
+from packed import BLOB_NAME
+
+CHECKPOINT_NAME = 'checkpoint.pkl'
+JOURNAL_NAME = 'checkpoint-windows.pkl' # Every sampled time window, appended one at a time so that checkpoints stay the same size however long a run gets
+POOLS_NAME = 'checkpoint-pools.npy' # The shuffled topic pools, which never change during a run and are only saved once
+
+def output_file(gen):
+    """ Returns the single file which the time windows are appended to in manifest and packed mode, or None when each window has its own folder """
+    if gen.output_mode == 'manifest': return os.path.join(gen.output_path, MANIFEST_NAME)
+    if gen.output_mode == 'packed': return os.path.join(gen.output_path, BLOB_NAME)
+    return None
+
+def file_size(path):
+    """ Returns the size of a file, or 0 if it does not exist yet """
+    return os.path.getsize(path) if path is not None and os.path.exists(path) else 0
+
+def journal_window(gen):
+    """ Appends the latest time window of a generator, and any other per-window entries such as its drift flag, to the journal """
+    with open(os.path.join(gen.output_path, JOURNAL_NAME), 'ab') as f:
+        pickle.dump(tuple(getattr(gen, name)[-1] for name in gen.journal_attributes), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def save_checkpoint(gen):
+    """ Saves the sampling state of a ConceptShift or ConceptDrift generator, its random number generators, its parameters and the size of its output
+        and journal so far. The checkpoint is written to a temporary file first, so that an interruption never leaves a partial checkpoint behind """
+    pools_path = os.path.join(gen.output_path, POOLS_NAME)
+    if not os.path.exists(pools_path):
+        with open(pools_path + '.tmp', 'wb') as f:
+            np.save(f, np.concatenate(gen.pools) if gen.pools else np.zeros(0, dtype=int))
+        os.replace(pools_path + '.tmp', pools_path)
+    state = {name: getattr(gen, name) for name in gen.checkpoint_attributes}
+    state.update({'random': gen.random.getstate(), 'np_random': gen.np_random.get_state(), 'topics': gen.topics, 'pool_sizes': gen.pool_sizes})
+    state['parameters'] = {name: getattr(gen, name) for name in gen.checkpoint_parameters}
+    state['num_windows'] = len(gen.time_windows)
+    state['journal_size'] = file_size(os.path.join(gen.output_path, JOURNAL_NAME))
+    state['output_size'] = file_size(output_file(gen))
+    checkpoint_path = os.path.join(gen.output_path, CHECKPOINT_NAME)
+    with open(checkpoint_path + '.tmp', 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+def has_checkpoint(output_path):
+    """ Checks whether a checkpoint has been saved in an output folder """
+    return os.path.exists(os.path.join(output_path, CHECKPOINT_NAME))
+
+def load_checkpoint(gen):
+    """ Restores the state of a generator from the checkpoint in its output folder and removes anything saved after the checkpoint was taken,
+        as those time windows are sampled again. Raises a ValueError unless the generator was created with the same corpus, parameters and output mode """
+    with open(os.path.join(gen.output_path, CHECKPOINT_NAME), 'rb') as f:
+        state = pickle.load(f)
+    if list(state['topics']) != list(gen.topics) or not np.array_equal(state['pool_sizes'], gen.pool_sizes):
+        raise ValueError('The corpus has changed since the checkpoint in %s was saved' % gen.output_path)
+    mismatched = ['%s=%s (checkpoint has %s)' % (name, getattr(gen, name), value) for name, value in state['parameters'].items() if getattr(gen, name) != value]
+    if mismatched: raise ValueError('The checkpoint in %s was saved with different parameters: %s' % (gen.output_path, ', '.join(mismatched)))
+    for name in gen.checkpoint_attributes:
+        setattr(gen, name, state[name])
+    gen.pools = np.split(np.load(os.path.join(gen.output_path, POOLS_NAME)), np.cumsum(gen.pool_sizes)[:-1])
+    read_journal(gen, state['num_windows'], state['journal_size'])
+    gen.random.setstate(state['random'])
+    gen.np_random.set_state(state['np_random'])
+    truncate_output(gen, state['output_size'])
+
+def read_journal(gen, num_windows, journal_size):
+    """ Cuts the journal back to the time windows sampled when the checkpoint was taken and reads them back into the generator """
+    path = os.path.join(gen.output_path, JOURNAL_NAME)
+    entries = [[] for name in gen.journal_attributes]
+    if num_windows > 0:
+        with open(path, 'r+b') as f:
+            f.truncate(journal_size)
+            for window_num in range(num_windows):
+                for values, value in zip(entries, pickle.load(f)): values.append(value)
+    elif os.path.exists(path): os.remove(path)
+    for name, values in zip(gen.journal_attributes, entries):
+        setattr(gen, name, values)
+
+def truncate_output(gen, output_size):
+    """ Cuts the output of a generator back to the time windows it held when its checkpoint was taken """
+    path = output_file(gen)
+    if path is not None:
+        if os.path.exists(path):
+            with open(path, 'r+b') as f:
+                f.truncate(output_size)
+        return
+    window_num = len(gen.time_windows) + 1
+    while os.path.exists(gen.window_dir(window_num)):
+        shutil.rmtree(gen.window_dir(window_num))
+        window_num += 1
+
+def run_generation(gen, max_windows=None, checkpoint_every=None):
+    """ Samples and saves the time windows of a generator one at a time, until too few topics are left or the dataset has max_windows windows.
+        Every checkpoint_every windows, and once finished, a checkpoint is saved so that the run can be resumed or extended later.
+        Documents in a compressed tar can only be read in a pass over the whole archive, so for such a corpus the windows are instead
+        saved together at each checkpoint and at the end. Returns the number of time windows generated """
+    start = unsaved = len(gen.time_windows)
+    buffered = any(len(topic_filepaths) > 0 and in_compressed_tar(topic_filepaths[0]) for topic_filepaths in gen.filepaths)
+    while len(gen.cur_topics) >= gen.min_topics and (max_windows is None or len(gen.time_windows) < max_windows):
+        with gen.stats.phase('sample'):
+            gen.generate_window()
+            gen.choose_next_window_topics()
+        if not buffered: unsaved = save_unsaved_windows(gen, unsaved)
+        if checkpoint_every:
+            journal_window(gen)
+            if len(gen.time_windows) % checkpoint_every == 0:
+                unsaved = save_unsaved_windows(gen, unsaved)
+                save_checkpoint(gen)
+    unsaved = save_unsaved_windows(gen, unsaved)
+    with gen.stats.phase('save'):
+        gen.finish_output()
+    if checkpoint_every: save_checkpoint(gen)
+    return len(gen.time_windows) - start
+
+def save_unsaved_windows(gen, unsaved):
+    """ Saves the time windows from unsaved (numbered from 0) onwards and returns the number of the next window to save """
+    if unsaved < len(gen.time_windows):
+        with gen.stats.phase('save'):
+            gen.save_windows(unsaved)
+    return len(gen.time_windows)
@@ -2,18 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import sys
 import random
 import numpy as np
-from shutil import copy
 from collections import Counter
 from optparse import OptionParser
+from corpus_index import load_corpus_index
+from overview import count_topics, write_overview
+from materialize import OUTPUT_MODES, supports_output_mode, write_manifest, materialize_files, report_throughput
+from packed import append_packed, write_packed_index
+from checkpoint import has_checkpoint, load_checkpoint, run_generation
+from instrumentation import Stats
+from vectorize import load_vectors, write_window_vectors
 
 class ConceptDrift():
     
-    def __init__(self, input_path, k, window_size, decrease_windows, increase_windows, min_topics, drift_prob, output_path):
-        self.filepaths = self.read_filepaths(input_path)
-        self.topic_mappings = self.create_topic_mappings(input_path)
+    def __init__(self, input_path, k, window_size, decrease_windows, increase_windows, min_topics, drift_prob, output_path, output_mode='copy', num_threads=8, cache_dir=None, seed=None, stats=None, vectorize=False):
+        self.random, self.np_random = random.Random(seed), np.random.RandomState(seed) # Explicit generators so that a run can be reproduced from its seed
+        self.stats = stats if stats is not None else Stats()
+        with self.stats.phase('index'):
+            self.topics, self.filepaths = self.read_filepaths(input_path, cache_dir)
+        self.vectors = None
+        if vectorize: # Term counts of every document, tokenized once per corpus and cached next to the corpus index
+            with self.stats.phase('vectorize'):
+                self.vectors = load_vectors(input_path, cache_dir, num_threads)
+        self.pools, self.cursors = self.create_topic_pools()
+        self.pool_sizes = np.array([len(pool) for pool in self.pools])
+        self.topic_mappings = self.create_topic_mappings()
         self.remaining_topics = list(np.arange(len(self.filepaths)))
         self.time_windows, self.drift_list =  ([] for i in range(2))
         self.num_topics = k
@@ -23,66 +39,125 @@ class ConceptDrift():
         self.min_topics = min_topics
         self.drift_prob = drift_prob
         self.output_path = output_path
+        self.output_mode = output_mode
+        self.num_threads = num_threads
         self.drift = False
+        self.window_num = 0
         self.cur_topics, self.probabilities = self.generate_initial_topics()
         self.increase_topic = 0
         self.decrease_topic = 0
         self.increase_prob = 0
         self.counter = 0
         self.remove_topics = set()
+        self.schedule, self.schedule_topics = None, []
+        self.checkpoint_parameters = ['num_topics', 'window_size', 'decrease_windows', 'increase_windows', 'min_topics', 'drift_prob', 'output_mode'] # Must match when a run is resumed
+        self.checkpoint_attributes = ['window_num', 'cursors', 'remaining_topics', 'cur_topics', 'probabilities',
+                                      'drift', 'increase_topic', 'decrease_topic', 'increase_prob', 'counter', 'remove_topics', 'schedule', 'schedule_topics']
+        self.journal_attributes = ['time_windows', 'drift_list'] # Lists with one entry per time window, journaled window by window rather than checkpointed
                
-    def read_filepaths(self, directory):
-        """ Reads dataset directory and stores the filepaths (documents) from each topic  """
-        folder_paths = [os.path.join(directory, folder) for folder in os.listdir(directory) if not folder.startswith('.')]
-        filepaths = [[os.path.join(cur_folder, cur_file) for cur_file in os.listdir(cur_folder)] for cur_folder in folder_paths]
-        return filepaths
+    def read_filepaths(self, directory, cache_dir=None):
+        """ Reads the topic names and the filepaths (documents) from each topic from the cached index of the dataset directory """
+        return load_corpus_index(directory, cache_dir)
     
-    def create_topic_mappings(self, directory):
+    def create_topic_pools(self):
+        """ Creates a pre-shuffled index array and a cursor for each topic so documents can be drawn without replacement in O(1) """
+        pools = [self.np_random.permutation(len(topic_filepaths)) for topic_filepaths in self.filepaths]
+        cursors = np.zeros(len(self.filepaths), dtype=int)
+        return pools, cursors
+
+    def documents_left(self, topic_nums):
+        """ Returns the number of filepaths (documents) which have not yet been drawn from each of the given topics """
+        return self.pool_sizes[topic_nums] - self.cursors[topic_nums]
+
+    def draw_documents(self, topic_num, count):
+        """ Draws the next count filepaths (documents) from the shuffled pool of a topic """
+        start = self.cursors[topic_num]
+        self.cursors[topic_num] += count
+        return self.filepaths[topic_num][self.pools[topic_num][start:start + count]].tolist()
+
+    def create_topic_mappings(self):
         """ Creates a mapping of topic names to an integer representaion """
-        topics = [folder for folder in os.listdir(directory) if not folder.startswith('.')]
         indices = np.arange(len(self.filepaths))
-        return dict(zip(indices, topics))
+        return dict(zip(indices, self.topics))
            
     def generate_initial_topics(self):
         """ Generates the initial set of topics """
-        cur_topics = random.sample(self.remaining_topics, self.num_topics)
+        cur_topics = self.random.sample(self.remaining_topics, self.num_topics)
         self.remaining_topics = [topic for topic in self.remaining_topics if topic not in cur_topics]
-        probabilities = list(np.random.dirichlet(np.ones(self.num_topics)))
+        probabilities = self.np_random.dirichlet(np.ones(self.num_topics))
         return cur_topics, probabilities
     
     def generate_window(self):
         """ Generates a time window of filepaths (documents) of a fixed size"""
+        self.window_num += 1
+        start = time.perf_counter()
         cur_window = []
-        for i in range(self.window_size):
-            if len(self.cur_topics) < self.min_topics: break
-            self.probabilities = [float(i)/sum(self.probabilities) for i in self.probabilities] # Normalises the probabilities if sum is slightly greater than 1.0
-            topic_num = np.random.choice(self.cur_topics, p=self.probabilities)
-            if len(self.filepaths[topic_num]) == 0 and (self.increase_topic == topic_num or self.decrease_topic == topic_num) and self.drift: # If either the increase_topic or decrease_topic runs out of documents during a concept drift
+        num_draws = self.window_size
+        while num_draws > 0 and len(self.cur_topics) >= self.min_topics:
+            assignments, topic_num = self.draw_topic_assignments(num_draws)
+            num_draws -= len(assignments)
+            cur_window.extend(self.fill_assignments(assignments[self.documents_left(assignments) > 0] if self.remove_topics else assignments))
+            if topic_num is None: continue
+            self.stats.event('topic_exhausted', topic=self.topics[topic_num])
+            num_draws -= 1 # The draw of a topic which has run out of documents still uses up a place in the window
+            if (self.increase_topic == topic_num or self.decrease_topic == topic_num) and self.drift: # If either the increase_topic or decrease_topic runs out of documents during a concept drift
                 self.disable_drift()
-                self.drift_list.append(self.drift)
-            elif len(self.filepaths[topic_num]) == 0 and not self.drift: # If a topic runs out of documents and not in a concept drift
+            elif not self.drift: # If a topic runs out of documents and not in a concept drift
                 self.distribute_topic_probabilities(topic_num)
-            elif len(self.filepaths[topic_num]) == 0 and self.drift: # If a topic runs out of documents and in a concept drift
+            else: # If a topic runs out of documents and in a concept drift
                 self.remove_topics.add(topic_num)
-                continue
-            else:
-                doc_num = random.randint(0, len(self.filepaths[topic_num])-1)
-                cur_window.append(self.filepaths[topic_num][doc_num])
-                del self.filepaths[topic_num][doc_num]
         self.drift_list.append(self.drift)
         self.time_windows.append(cur_window)
+        self.stats.window(self.window_num, time.perf_counter() - start, len(cur_window))
+
+    def draw_topic_assignments(self, num_draws):
+        """ Draws the topics for a batch of documents from the cumulative probabilities of the current topics.
+            The batch is cut at the first draw of a topic which has run out of documents, and that topic is returned alongside it """
+        self.probabilities = self.probabilities / self.probabilities.sum() # Normalises the probabilities if sum is slightly greater than 1.0
+        self.stats.count('renormalizations')
+        cumulative = np.cumsum(self.probabilities)
+        indices = np.minimum(np.searchsorted(cumulative, self.np_random.random(num_draws) * cumulative[-1], side='right'), len(self.cur_topics) - 1)
+        assignments = np.asarray(self.cur_topics)[indices]
+        ranks = np.empty(num_draws, dtype=int)
+        for topic_num, positions in self.group_assignments(assignments):
+            ranks[positions] = np.arange(len(positions)) # Occurrence number of each topic within the batch
+        empty = ranks >= self.documents_left(assignments)
+        if self.remove_topics: empty &= ~np.isin(assignments, list(self.remove_topics)) # Topics already known to be empty during a drift just use up their draws
+        exhausted = np.flatnonzero(empty)
+        if len(exhausted) == 0: return assignments, None
+        return assignments[:exhausted[0]], assignments[exhausted[0]]
+
+    def group_assignments(self, assignments):
+        """ Groups the positions of a batch of topic assignments by topic, keeping the positions of each topic in order """
+        order = np.argsort(assignments, kind='stable')
+        boundaries = np.flatnonzero(np.diff(assignments[order])) + 1
+        return [(assignments[positions[0]], positions) for positions in np.split(order, boundaries) if len(positions) > 0]
+
+    def fill_assignments(self, assignments):
+        """ Replaces each topic assignment with the next filepath (document) drawn from that topic """
+        documents = np.empty(len(assignments), dtype=object)
+        for topic_num, positions in self.group_assignments(assignments):
+            documents[positions] = self.draw_documents(topic_num, len(positions))
+        return list(documents)
         
+    def iter_windows(self, keep_windows=True):
+        """ Generates the time windows one at a time, yielding each window of filepaths (documents) as soon as it has been sampled.
+            With keep_windows=False the windows are not kept in time_windows, so memory stays bounded to one window """
+        while len(self.cur_topics) >= self.min_topics:
+            self.generate_window()
+            yield self.time_windows[-1] if keep_windows else self.time_windows.pop()
+            self.choose_next_window_topics()
+
     def distribute_topic_probabilities(self, topic_num): # Only runs when not in a concept drift
         """ Removes a topic and distributes its probability evenly over the remaining currently selected topics """
         index = self.cur_topics.index(topic_num)
         self.cur_topics.remove(topic_num)  
         prob = self.probabilities[index] / len(self.cur_topics)
-        del self.probabilities[index]
-        self.probabilities = [x + prob for x in self.probabilities]
+        self.probabilities = np.delete(self.probabilities, index) + prob
               
     def choose_next_window_topics(self):
         """ Chooses randomly whether to activate a concept shift for the next window or keep the current selection of topics """
-        if random.uniform(0,1) < self.drift_prob and not self.drift and not len(self.remaining_topics) == 0: 
+        if self.random.uniform(0,1) < self.drift_prob and not self.drift and not len(self.remaining_topics) == 0: 
             self.enable_drift()  
             print('Drift enabled')
         if self.drift: 
@@ -94,119 +169,145 @@ class ConceptDrift():
             self.disable_drift()
             return
         if self.counter == self.decrease_windows: self.remove_decreasing_topic()          
-        self.increase_probabilities() 
-        if self.counter < self.decrease_windows:  self.decrease_probabilities()
+        columns = {topic: column for column, topic in enumerate(self.schedule_topics)}
+        self.probabilities = self.schedule[self.counter, [columns[topic] for topic in self.cur_topics]]
         self.counter += 1 
+
+    def build_drift_schedule(self): # Assumes that the number of increase windows is always bigger than the number of decrease windows 
+        """ Computes the probabilities of the current topics for every window of a drift as a windows x topics array """
+        probabilities = np.array(self.probabilities, dtype=float)
+        increase_topic_index = self.cur_topics.index(self.increase_topic)
+        decrease_topic_index = self.cur_topics.index(self.decrease_topic)
+        active = np.ones(len(probabilities), dtype=bool)
+        schedule = np.zeros((self.increase_windows, len(probabilities)))
+        for counter in range(self.increase_windows):
+            if counter == self.decrease_windows: # The decreasing topic is removed once it has been fully decreased
+                active[decrease_topic_index] = False
+                probabilities[decrease_topic_index] = 0.0
+            if active.sum() < 2: # Only one topic is left, so there is nothing to move probability between
+                schedule[counter:] = probabilities
+                break
+            self.increase_probabilities(probabilities, active, increase_topic_index, counter)
+            if counter < self.decrease_windows: self.decrease_probabilities(probabilities, active, decrease_topic_index, counter)
+            schedule[counter] = probabilities
+            probabilities /= probabilities[active].sum() # Sampling renormalises every window's probabilities, so the next step starts from a vector summing to 1
+        return schedule
         
     def drift_distribute_probabilities(self):
         """ Removes any topics that ran out of documents during a drift and distirbutes the probabilities amongst the topics that remain  """
-        for topic in self.remove_topics:
-            del self.probabilities[self.cur_topics.index(topic)]
-            self.cur_topics.remove(topic)
-        total = sum(self.probabilities)
-        for prob in range(len(self.probabilities)):
-            self.probabilities[prob] /= total
+        self.probabilities = np.delete(self.probabilities, [self.cur_topics.index(topic) for topic in self.remove_topics])
+        self.cur_topics = [topic for topic in self.cur_topics if topic not in self.remove_topics]
+        self.probabilities /= self.probabilities.sum()
         
     def remove_decreasing_topic(self): # Assumes that the number of increase windows is always bigger than the number of decrease windows 
         """ Removes the decreasing topic during a drift """
         if self.decrease_topic in self.remove_topics: self.remove_topics.remove(self.decrease_topic)
         decrease_topic_index =  self.cur_topics.index(self.decrease_topic)
         self.cur_topics.remove(self.decrease_topic)
-        del self.probabilities[decrease_topic_index]
+        self.probabilities = np.delete(self.probabilities, decrease_topic_index)
         self.remaining_topics.append(self.decrease_topic)
         
-    def increase_probabilities(self):
+    def increase_probabilities(self, probabilities, active, increase_topic_index, counter):
         """ Increases the increase topic probability while decreasing all remaining topics accordingly """
-        increase_topic_index = self.cur_topics.index(self.increase_topic)
-        remaining_prob = self.increase_prob - self.probabilities[increase_topic_index] # How much is left to work with
-        remaining_windows = self.increase_windows - self.counter 
+        remaining_prob = self.increase_prob - probabilities[increase_topic_index] # How much is left to work with
+        remaining_windows = self.increase_windows - counter 
         cur_prob = remaining_prob / remaining_windows
-        for i in range(len(self.probabilities)):
-            if i == increase_topic_index: self.probabilities[i] += cur_prob       
-            else:
-                self.probabilities[i] -= cur_prob/(len(self.probabilities)-1)
-                if self.probabilities[i] < 0: self.probabilities[i] = 0
+        others = active.copy()
+        others[increase_topic_index] = False
+        probabilities[others] = np.maximum(probabilities[others] - cur_prob/(active.sum()-1), 0)
+        probabilities[increase_topic_index] += cur_prob
             
-    def decrease_probabilities(self):
-         """ Decreases the decrease topic probability while increasing all remaining topics accordingly """
-         if self.counter < self.decrease_windows: 
-            decrease_topic_index = self.cur_topics.index(self.decrease_topic)      
-            remaining_prob = self.probabilities[decrease_topic_index] # How much is left to work with
-            remaining_windows = self.decrease_windows - self.counter 
-            cur_prob = remaining_prob / remaining_windows
-            for i in range(len(self.probabilities)):
-                 if i == decrease_topic_index: self.probabilities[i] -= cur_prob
-                 else:  self.probabilities[i] += cur_prob/(len(self.probabilities)-1)
+    def decrease_probabilities(self, probabilities, active, decrease_topic_index, counter):
+        """ Decreases the decrease topic probability while increasing all remaining topics accordingly """
+        remaining_prob = probabilities[decrease_topic_index] # How much is left to work with
+        remaining_windows = self.decrease_windows - counter 
+        cur_prob = remaining_prob / remaining_windows
+        others = active.copy()
+        others[decrease_topic_index] = False
+        probabilities[others] += cur_prob/(active.sum()-1)
+        probabilities[decrease_topic_index] -= cur_prob
                                           
     def enable_drift(self):
         """ Enables concept drift """
         self.drift = True
         self.counter = 0
-        self.decrease_topic = np.random.choice(self.cur_topics)
-        self.increase_topic = np.random.choice(self.remaining_topics)
+        self.decrease_topic = self.np_random.choice(self.cur_topics)
+        self.increase_topic = self.np_random.choice(self.remaining_topics)
         self.remaining_topics.remove(self.increase_topic)
         self.increase_prob = np.mean(self.probabilities)
-        self.probabilities.append(0.0)
+        self.probabilities = np.append(self.probabilities, 0.0)
         self.cur_topics.append(self.increase_topic)
         self.remove_topics = set()
+        self.schedule_topics = list(self.cur_topics)
+        self.schedule = self.build_drift_schedule()
+        self.stats.event('drift_enabled', increase_topic=self.topics[self.increase_topic], decrease_topic=self.topics[self.decrease_topic])
                        
     def disable_drift(self):
         """ Disables concept drift """
         self.drift = False
         self.drift_distribute_probabilities()
+        self.stats.event('drift_disabled')
         self.counter = 0
         
-    def save_dataset(self):
-        """ Saves the dataset into folder designated by output_path """
-        if os.path.exists(self.output_path):
+    def window_dir(self, window_num):
+        """ Returns the folder a time window (numbered from 1) is saved into """
+        return os.path.join(self.output_path, "window-{0:02d}".format(window_num))
+
+    def kept_documents(self, cur_window):
+        """ Returns the filepaths (documents) of a time window paired with their topics, leaving out topics with less than 10 documents """
+        topics = [os.path.basename(os.path.dirname(doc)) for doc in cur_window]
+        topic_distribution = Counter(topics)
+        return [(filepath, topic) for filepath, topic in zip(cur_window, topics) if topic_distribution[topic] >= 10]
+
+    def prepare_output(self, resume=False):
+        """ Creates the folder designated by output_path, exiting if it already exists unless an earlier run is being resumed """
+        if os.path.exists(self.output_path) and not resume:
             print('Directory already exists. EXITING.')
             sys.exit()
         if not os.path.exists(self.output_path): os.mkdir(self.output_path)
-        for window_num, cur_window in enumerate(self.time_windows):
-            topic_distribution = Counter([os.path.basename(os.path.dirname(doc)) for doc in cur_window])
-            remove_topics = [topic for topic in topic_distribution if topic_distribution[topic] < 10]
-            window_dir = (os.path.join(self.output_path, "window-{0:02d}".format(window_num + 1)))
-            if not os.path.exists(window_dir): os.mkdir(window_dir)
-            for filepath in cur_window:
-                topic = os.path.basename(os.path.dirname(filepath))
-                topic_dir = os.path.join(os.path.join(window_dir, topic))
-                if not os.path.exists(topic_dir) and topic not in remove_topics: os.mkdir(topic_dir)
-                if topic not in remove_topics: copy(filepath, topic_dir)
-            
-    def write_csv(self):
-        """ Creates an overview of the drift dataset and saves it in as a csv file """
-        topic_distributions = []
-        num_topics = []
-        num_docs = []
-        for window_num, cur_folder in enumerate(os.listdir(self.output_path)):
-            num_topics.append(len(os.listdir(os.path.join(self.output_path, cur_folder))))
-            window_dir = os.path.join(self.output_path, cur_folder) 
-            filepaths = []
-            for topic in os.listdir(window_dir):
-                topic_dir = os.path.join(window_dir,topic)
-                for file in os.listdir(topic_dir):
-                    filepaths.append(os.path.join(topic_dir, file))
-            topic_dict = Counter([os.path.basename(os.path.dirname(doc)) for doc in filepaths])
-            num_docs.append(sum(topic_dict.values()))
-            topic_distributions.append(self.calculate_window_distribution(len(self.filepaths), self.topic_mappings, topic_dict))
+
+    def save_windows(self, start=0):
+        """ Saves the time windows from start (numbered from 0) onwards into the folder designated by output_path """
+        rows, placements, kept_windows = ([] for i in range(3))
+        for window_num, cur_window in enumerate(self.time_windows[start:], start):
+            kept = self.kept_documents(cur_window)
+            kept_windows.append([filepath for filepath, topic in kept])
+            if self.output_mode == 'manifest':
+                rows.extend((window_num + 1, topic, filepath, self.drift_list[window_num]) for filepath, topic in kept)
+            elif self.output_mode != 'packed':
+                window_dir = self.window_dir(window_num + 1)
+                os.mkdir(window_dir)
+                placements.extend((filepath, os.path.join(window_dir, topic)) for filepath, topic in kept)
+        if self.output_mode == 'manifest': self.record_output(write_manifest(self.output_path, ['window', 'topic', 'source', 'drift'], rows))
+        elif self.output_mode == 'packed':
+            begin = time.time()
+            sizes = append_packed(self.output_path, kept_windows, self.num_threads)
+            self.record_output((len(sizes), int(sizes.sum()), time.time() - begin))
+        else: self.record_output(materialize_files(placements, self.output_mode, self.num_threads))
+
+    def finish_output(self):
+        """ Completes the saved dataset once all of its time windows have been saved, and reports the throughput of saving them """
+        kept_windows = [[filepath for filepath, topic in self.kept_documents(cur_window)] for cur_window in self.time_windows]
+        if self.output_mode == 'packed': write_packed_index(self.output_path, kept_windows, self.topics, self.drift_list)
+        if self.vectors is not None: write_window_vectors(self.output_path, kept_windows, self.vectors)
+        report_throughput(self.stats.output['files'], self.stats.output['bytes'], self.stats.output['seconds'])
+
+    def save_dataset(self):
+        """ Saves the dataset into folder designated by output_path """
+        self.prepare_output()
+        self.save_windows()
+        self.finish_output()
+
+    def record_output(self, result):
+        """ Records the number of files, bytes and seconds taken to save time windows """
+        self.stats.record_output(*result)
             
-        with open(os.path.join(self.output_path,'drift_overview.csv'), 'w') as f:
-             heading = ['Num Topics', 'Num Docs', 'Drift']
-             for i in range(1,len(self.filepaths)+1):
-                 heading.append('Topic %s ' % i)
-             f.write(','.join(heading)+'\n')
-             for i in range(len(topic_distributions)):
-                f.write(str(num_topics[i]) + ',' + str(num_docs[i]) + ',' + str(self.drift_list[i]) + ',' + ','.join(topic_distributions[i]) + '\n')
-
-    def calculate_window_distribution(self, total_topics, topic_mappings, topic_dict):
-        """ Calculates the number of documents in each topic for a time window """
-        topic_distributions = []
-        for i in range(total_topics):
-            if topic_mappings[i] in topic_dict:
-                topic_distributions.append("%.3f" % (topic_dict[topic_mappings[i]] / sum(topic_dict.values())))
-            else:
-                topic_distributions.append('0.0')
-        return topic_distributions        
+    def write_csv(self, save_counts=False):
+        """ Creates an overview of the drift dataset from the sampled time windows and saves it as a csv file, and optionally the topic counts as a .npy file """
+        counts = count_topics(self.time_windows, self.topics)
+        counts[counts < 10] = 0 # Topics with less than 10 documents are left out of the saved windows
+        write_overview(os.path.join(self.output_path, 'drift_overview.csv'), counts, [('Drift', self.drift_list)])
+        if save_counts: np.save(os.path.join(self.output_path, 'drift_counts.npy'), counts)
 
 #----------------------------------------------------------------------------------------------------- 
 def main():
@@ -219,18 +320,36 @@ def main():
     parser.add_option("--min_topics", action="store", type="int", dest="min_topics", help="minimum number of topics before ending", default=3)
     parser.add_option("--drift_prob", action="store", type="float", dest="drift_prob", help="probability of a concept drift occuring", default=0.05)
     parser.add_option("--output", action="store", type="string", dest="output_path", help="filepath and folder name where dataset will be stored", default=None)
+    parser.add_option("--output_mode", action="store", type="choice", choices=OUTPUT_MODES, dest="output_mode", help="how documents are stored: %s" % ", ".join(OUTPUT_MODES), default="copy")
+    parser.add_option("--threads", action="store", type="int", dest="num_threads", help="number of threads used to copy or link documents", default=8)
+    parser.add_option("--cache_dir", action="store", type="string", dest="cache_dir", help="folder where the corpus index is cached instead of inside the input folder", default=None)
+    parser.add_option("--save_counts", action="store_true", dest="save_counts", help="also save the windows x topics document counts as a .npy file", default=False)
+    parser.add_option("--seed", action="store", type="int", dest="seed", help="seed for the random number generators, so that the dataset can be reproduced", default=None)
+    parser.add_option("--stats", action="store", type="string", dest="stats", help="json file to write the timings and counters of the run to", default=None)
+    parser.add_option("--vectors", action="store_true", dest="vectors", help="also save the term counts of each time window as a sparse matrix, from a cached tokenization of the corpus", default=False)
+    parser.add_option("--checkpoint_every", action="store", type="int", dest="checkpoint_every", help="save a checkpoint every N time windows so that an interrupted run can be resumed", default=None)
+    parser.add_option("--resume", action="store_true", dest="resume", help="resume an interrupted run, or extend a finished one, from the checkpoint in the output folder", default=False)
+    parser.add_option("--max_windows", action="store", type="int", dest="max_windows", help="stop once the dataset has this many time windows in total", default=None)
     (options, args) = parser.parse_args()
 
-    gen = ConceptDrift(options.input_path, options.num_topics, options.window_size, options.decrease_windows, options.increase_windows, options.min_topics, options.drift_prob, options.output_path)
+    if not supports_output_mode(options.input_path, options.output_mode):
+        print('Documents inside an archive cannot be stored with output mode "%s". EXITING.' % options.output_mode)
+        sys.exit(1)
+    gen = ConceptDrift(options.input_path, options.num_topics, options.window_size, options.decrease_windows, options.increase_windows, options.min_topics, options.drift_prob, options.output_path, options.output_mode, options.num_threads, options.cache_dir, options.seed, vectorize=options.vectors)
     
-    print("Generating dataset...")  
-    while(len(gen.cur_topics) >= gen.min_topics):
-        gen.generate_window()
-        gen.choose_next_window_topics()
-    print("Saving dataset...")
-    gen.save_dataset()
+    if options.resume:
+        if not has_checkpoint(options.output_path):
+            print('No checkpoint to resume from in "%s". EXITING.' % options.output_path)
+            sys.exit(1)
+        load_checkpoint(gen)
+        print("Resuming from window %d..." % (len(gen.time_windows) + 1))
+    gen.prepare_output(options.resume)
+    print("Generating and saving dataset...")
+    run_generation(gen, options.max_windows, options.checkpoint_every)
     print("Generating overview...")
-    gen.write_csv()
+    with gen.stats.phase('overview'):
+        gen.write_csv(options.save_counts)
+    if options.stats: gen.stats.save(options.stats)
     print("Finished.")
 
 #-----------------------------------------------------------------------------------------------------     
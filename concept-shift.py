@@ -2,18 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import sys
 import random
 import numpy as np
-from shutil import copy
 from collections import Counter
 import matplotlib.pyplot as plt
 from optparse import OptionParser
+from corpus_index import load_corpus_index
+from overview import count_topics, write_overview
+from materialize import OUTPUT_MODES, supports_output_mode, write_manifest, materialize_files, report_throughput
+from packed import append_packed, write_packed_index
+from checkpoint import has_checkpoint, load_checkpoint, run_generation
+from instrumentation import Stats
+from vectorize import load_vectors, write_window_vectors
 
 class ConceptShift():
     
-    def __init__(self, input_path, k, window_size, min_topics, shift_prob, output_path):
-        self.filepaths = self.read_filepaths(input_path)
+    def __init__(self, input_path, k, window_size, min_topics, shift_prob, output_path, output_mode='copy', num_threads=8, cache_dir=None, seed=None, stats=None, vectorize=False):
+        self.random, self.np_random = random.Random(seed), np.random.RandomState(seed) # Explicit generators so that a run can be reproduced from its seed
+        self.stats = stats if stats is not None else Stats()
+        with self.stats.phase('index'):
+            self.topics, self.filepaths = self.read_filepaths(input_path, cache_dir)
+        self.vectors = None
+        if vectorize: # Term counts of every document, tokenized once per corpus and cached next to the corpus index
+            with self.stats.phase('vectorize'):
+                self.vectors = load_vectors(input_path, cache_dir, num_threads)
+        self.pools, self.cursors = self.create_topic_pools()
+        self.pool_sizes = np.array([len(pool) for pool in self.pools])
         self.remaining_topics = list(np.arange(len(self.filepaths)))
         self.time_windows, self.ground_truth = ([] for i in range(2))
         self.num_topics = k
@@ -21,69 +37,160 @@ class ConceptShift():
         self.min_topics = min_topics
         self.shift_prob = shift_prob
         self.output_path = output_path
+        self.output_mode = output_mode
+        self.num_threads = num_threads
         self.window_num = 0
         self.cur_topics = self.generate_initial_topics()
+        self.checkpoint_parameters = ['num_topics', 'window_size', 'min_topics', 'shift_prob', 'output_mode'] # Must match when a run is resumed
+        self.checkpoint_attributes = ['window_num', 'cursors', 'remaining_topics', 'cur_topics']
+        self.journal_attributes = ['time_windows'] # Lists with one entry per time window, journaled window by window rather than checkpointed
               
-    def read_filepaths(self, directory):
-        """ Reads dataset directory and stores the filepaths (documents) from each topic """
-        folder_paths = [os.path.join(directory, folder) for folder in os.listdir(directory) if not folder.startswith('.')]
-        filepaths = [[os.path.join(cur_folder, cur_file) for cur_file in os.listdir(cur_folder)] for cur_folder in folder_paths]
-        return filepaths
+    def read_filepaths(self, directory, cache_dir=None):
+        """ Reads the topic names and the filepaths (documents) from each topic from the cached index of the dataset directory """
+        return load_corpus_index(directory, cache_dir)
     
+    def create_topic_pools(self):
+        """ Creates a pre-shuffled index array and a cursor for each topic so documents can be drawn without replacement in O(1) """
+        pools = [self.np_random.permutation(len(topic_filepaths)) for topic_filepaths in self.filepaths]
+        cursors = np.zeros(len(self.filepaths), dtype=int)
+        return pools, cursors
+
+    def documents_left(self, topic_nums):
+        """ Returns the number of filepaths (documents) which have not yet been drawn from each of the given topics """
+        return self.pool_sizes[topic_nums] - self.cursors[topic_nums]
+
+    def draw_documents(self, topic_num, count):
+        """ Draws the next count filepaths (documents) from the shuffled pool of a topic """
+        start = self.cursors[topic_num]
+        self.cursors[topic_num] += count
+        return self.filepaths[topic_num][self.pools[topic_num][start:start + count]].tolist()
+
     def generate_initial_topics(self):
         """ Generates the initial set of topics """
-        initial_topics = random.sample(self.remaining_topics, self.num_topics)
+        initial_topics = self.random.sample(self.remaining_topics, self.num_topics)
         self.remaining_topics = [topic for topic in self.remaining_topics if topic not in initial_topics]
         return initial_topics
     
     def generate_window(self):
         """ Generates a time window of filepaths (documents) of a fixed size """
         self.window_num += 1
+        start = time.perf_counter()
         cur_window = []
-        for i in range(self.window_size):
-            if len(self.cur_topics) < self.min_topics: break
-            topic_num = np.random.choice(self.cur_topics)
-            doc_num = random.randint(0, len(self.filepaths[topic_num])-1)
-            cur_window.append(self.filepaths[topic_num][doc_num])
-            del self.filepaths[topic_num][doc_num]
-            if len(self.filepaths[topic_num]) == 0: self.cur_topics.remove(topic_num) # If a topic runs out of documents
+        while len(cur_window) < self.window_size and len(self.cur_topics) >= self.min_topics:
+            assignments = self.draw_topic_assignments(self.window_size - len(cur_window))
+            cur_window.extend(self.fill_assignments(assignments))
         self.calculate_topic_distribution(cur_window)
         self.time_windows.append(cur_window)
-        
+        self.stats.window(self.window_num, time.perf_counter() - start, len(cur_window))
+
+    def draw_topic_assignments(self, num_docs):
+        """ Draws the topics for a batch of documents, truncated at the first document that exhausts a topic """
+        assignments = self.np_random.choice(self.cur_topics, size=num_docs)
+        ranks = np.empty(num_docs, dtype=int)
+        for topic_num, positions in self.group_assignments(assignments):
+            ranks[positions] = np.arange(len(positions)) # Occurrence number of each topic within the batch
+        documents_left = self.documents_left(assignments)
+        exhausted = np.flatnonzero(ranks + 1 == documents_left)
+        if len(exhausted) > 0: # If a topic runs out of documents, the remaining documents are drawn from the topics which are left
+            assignments = assignments[:exhausted[0] + 1]
+            self.cur_topics.remove(assignments[-1])
+            self.stats.event('topic_exhausted', topic=self.topics[assignments[-1]])
+        return assignments
+
+    def group_assignments(self, assignments):
+        """ Groups the positions of a batch of topic assignments by topic, keeping the positions of each topic in order """
+        order = np.argsort(assignments, kind='stable')
+        boundaries = np.flatnonzero(np.diff(assignments[order])) + 1
+        return [(assignments[positions[0]], positions) for positions in np.split(order, boundaries)]
+
+    def fill_assignments(self, assignments):
+        """ Replaces each topic assignment with the next filepath (document) drawn from that topic """
+        documents = np.empty(len(assignments), dtype=object)
+        for topic_num, positions in self.group_assignments(assignments):
+            documents[positions] = self.draw_documents(topic_num, len(positions))
+        return list(documents)
+
+    def iter_windows(self, keep_windows=True):
+        """ Generates the time windows one at a time, yielding each window of filepaths (documents) as soon as it has been sampled.
+            With keep_windows=False the windows are not kept in time_windows, so memory stays bounded to one window """
+        while len(self.cur_topics) >= self.min_topics:
+            self.generate_window()
+            yield self.time_windows[-1] if keep_windows else self.time_windows.pop()
+            self.choose_next_window_topics()
+
     def choose_next_window_topics(self):
         """ Chooses randomly whether to activate a concept shift for the next window or to keep the current selection of topics """
-        if random.uniform(0,1) < self.shift_prob: 
-            if(random.randint(0,1) == 0): # Removes a topic
-                topic_num = np.random.choice(self.cur_topics)
+        if self.random.uniform(0,1) < self.shift_prob: 
+            if(self.random.randint(0,1) == 0): # Removes a topic
+                topic_num = self.np_random.choice(self.cur_topics)
                 self.cur_topics.remove(topic_num)
-                self.remaining_topics.append(topic_num)      
+                self.remaining_topics.append(topic_num)
+                self.stats.event('topic_removed', topic=self.topics[topic_num])      
             else: 
                 if len(self.cur_topics) == len(self.filepaths): return # Can't add a topic if already using all available topics
-                topic_num = np.random.choice(self.remaining_topics)
+                topic_num = self.np_random.choice(self.remaining_topics)
                 self.remaining_topics.remove(topic_num)
-                self.cur_topics.append(topic_num)              
+                self.cur_topics.append(topic_num)
+                self.stats.event('topic_added', topic=self.topics[topic_num])              
        
     def calculate_topic_distribution(self, window):
         """ Calculates the number of filepaths (documents) for each topic in a time window """
         topic_distribution = Counter([os.path.basename(os.path.dirname(doc)) for doc in window])
         [print("Warning: Window %s, topic \"%s\" has less than 10 documents." % (self.window_num, topic)) for topic in topic_distribution if topic_distribution[topic] < 10]
 
-    def save_dataset(self):
-        """ Saves the dataset into folder designated by output_path """
-        if os.path.exists(self.output_path):
+    def window_dir(self, window_num):
+        """ Returns the folder a time window (numbered from 1) is saved into """
+        return os.path.join(self.output_path, 'window %s' % str(window_num))
+
+    def prepare_output(self, resume=False):
+        """ Creates the folder designated by output_path, exiting if it already exists unless an earlier run is being resumed """
+        if os.path.exists(self.output_path) and not resume:
             print('Directory already exists. EXITING.')
             sys.exit()
         if not os.path.exists(self.output_path): os.mkdir(self.output_path)
-        for window_num, cur_window in enumerate(self.time_windows):
-            window_dir = (os.path.join(self.output_path, ('window %s' % str(window_num + 1))))
-            if not os.path.exists(window_dir): os.mkdir(window_dir)
-            for filepath in cur_window:
-                topic = os.path.basename(os.path.dirname(filepath))
-                topic_dir = os.path.join(os.path.join(window_dir, topic))
-                if not os.path.exists(topic_dir): os.mkdir(topic_dir)
-                copy(filepath, topic_dir)
-            self.ground_truth.append((len(os.listdir(window_dir))))
+
+    def save_windows(self, start=0):
+        """ Saves the time windows from start (numbered from 0) onwards into the folder designated by output_path """
+        windows = list(enumerate(self.time_windows[start:], start + 1))
+        if self.output_mode == 'manifest':
+            rows = [(window_num, os.path.basename(os.path.dirname(filepath)), filepath) for window_num, cur_window in windows for filepath in cur_window]
+            self.record_output(write_manifest(self.output_path, ['window', 'topic', 'source'], rows))
+            return
+        if self.output_mode == 'packed':
+            begin = time.time()
+            sizes = append_packed(self.output_path, [cur_window for window_num, cur_window in windows], self.num_threads)
+            self.record_output((len(sizes), int(sizes.sum()), time.time() - begin))
+            return
+        placements = []
+        for window_num, cur_window in windows:
+            window_dir = self.window_dir(window_num)
+            os.mkdir(window_dir)
+            placements.extend((filepath, os.path.join(window_dir, os.path.basename(os.path.dirname(filepath)))) for filepath in cur_window)
+        self.record_output(materialize_files(placements, self.output_mode, self.num_threads))
+
+    def finish_output(self):
+        """ Completes the saved dataset once all of its time windows have been saved, and reports the throughput of saving them """
+        self.ground_truth = list((count_topics(self.time_windows, self.topics) > 0).sum(axis=1))
+        if self.output_mode == 'packed': write_packed_index(self.output_path, self.time_windows, self.topics)
+        if self.vectors is not None: write_window_vectors(self.output_path, self.time_windows, self.vectors)
+        report_throughput(self.stats.output['files'], self.stats.output['bytes'], self.stats.output['seconds'])
+
+    def save_dataset(self):
+        """ Saves the dataset into folder designated by output_path """
+        self.prepare_output()
+        self.save_windows()
+        self.finish_output()
+
+    def record_output(self, result):
+        """ Records the number of files, bytes and seconds taken to save time windows """
+        self.stats.record_output(*result)
     
+    def write_csv(self, save_counts=False):
+        """ Creates an overview of the shift dataset from the sampled time windows and saves it as a csv file, and optionally the topic counts as a .npy file """
+        counts = count_topics(self.time_windows, self.topics)
+        write_overview(os.path.join(self.output_path, 'shift_overview.csv'), counts)
+        if save_counts: np.save(os.path.join(self.output_path, 'shift_counts.npy'), counts)
+
     def plot_dataset(self): 
         """ Plots the distribution of topics over all time windows """
         plt.plot(self.ground_truth, marker='o')
@@ -101,19 +208,40 @@ def main():
     parser.add_option("--min_topics", action="store", type="int", dest="min_topics", help="minimum topics before ending", default=3)
     parser.add_option("--shift_prob", action="store", type="float", dest="shift_prob", help="probability of a concept shift occuring", default=0.05)
     parser.add_option("--output", action="store", type="string", dest="output_path", help="filepath and folder name where dataset will be stored", default=0.05)
+    parser.add_option("--output_mode", action="store", type="choice", choices=OUTPUT_MODES, dest="output_mode", help="how documents are stored: %s" % ", ".join(OUTPUT_MODES), default="copy")
+    parser.add_option("--threads", action="store", type="int", dest="num_threads", help="number of threads used to copy or link documents", default=8)
+    parser.add_option("--save_counts", action="store_true", dest="save_counts", help="also save the windows x topics document counts as a .npy file", default=False)
     parser.add_option('-d','--debug',type="int",help="Level of log output; 0 is less, 5 is all", default=3)
+    parser.add_option("--cache_dir", action="store", type="string", dest="cache_dir", help="folder where the corpus index is cached instead of inside the input folder", default=None)
+    parser.add_option("--seed", action="store", type="int", dest="seed", help="seed for the random number generators, so that the dataset can be reproduced", default=None)
+    parser.add_option("--stats", action="store", type="string", dest="stats", help="json file to write the timings and counters of the run to", default=None)
+    parser.add_option("--vectors", action="store_true", dest="vectors", help="also save the term counts of each time window as a sparse matrix, from a cached tokenization of the corpus", default=False)
+    parser.add_option("--checkpoint_every", action="store", type="int", dest="checkpoint_every", help="save a checkpoint every N time windows so that an interrupted run can be resumed", default=None)
+    parser.add_option("--resume", action="store_true", dest="resume", help="resume an interrupted run, or extend a finished one, from the checkpoint in the output folder", default=False)
+    parser.add_option("--max_windows", action="store", type="int", dest="max_windows", help="stop once the dataset has this many time windows in total", default=None)
     (options, args) = parser.parse_args()
 
-    gen = ConceptShift(options.input_path, options.num_topics, options.window_size, options.min_topics, options.shift_prob, options.output_path)
+    if not supports_output_mode(options.input_path, options.output_mode):
+        print('Documents inside an archive cannot be stored with output mode "%s". EXITING.' % options.output_mode)
+        sys.exit(1)
+    gen = ConceptShift(options.input_path, options.num_topics, options.window_size, options.min_topics, options.shift_prob, options.output_path, options.output_mode, options.num_threads, options.cache_dir, options.seed, vectorize=options.vectors)
     
-    print("Generating dataset...")    
-    while(len(gen.cur_topics) >= gen.min_topics):
-        gen.generate_window()
-        gen.choose_next_window_topics()
-    print("Saving dataset...")
-    gen.save_dataset()	
+    if options.resume:
+        if not has_checkpoint(options.output_path):
+            print('No checkpoint to resume from in "%s". EXITING.' % options.output_path)
+            sys.exit(1)
+        load_checkpoint(gen)
+        print("Resuming from window %d..." % (len(gen.time_windows) + 1))
+    gen.prepare_output(options.resume)
+    print("Generating and saving dataset...")
+    run_generation(gen, options.max_windows, options.checkpoint_every)
+    print("Generating overview...")
+    with gen.stats.phase('overview'):
+        gen.write_csv(options.save_counts)
     print("Generating plot of dataset...")
-    gen.plot_dataset()
+    with gen.stats.phase('plot'):
+        gen.plot_dataset()
+    if options.stats: gen.stats.save(options.stats)
     print("Finished")
 
 #-----------------------------------------------------------------------------------------------------     
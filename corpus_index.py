@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import numpy as np
+from archive import is_archive, build_archive_index, archive_is_current, register_archive
+
+INDEX_NAME = '.corpus-index.npz' # An archive's index is named after it, e.g. .news.tar.gz.corpus-index.npz
+loaded_indexes = {} # Indexes already loaded by this process, which child processes inherit when forked
+
+def scan_corpus(directory):
+    """ Walks the dataset directory with os.scandir and returns the sorted topic names, the sorted filenames in each topic and the modification time of each topic folder """
+    topics = sorted(entry.name for entry in os.scandir(directory) if entry.is_dir() and not entry.name.startswith('.'))
+    filenames, mtimes = ([] for i in range(2))
+    for topic in topics:
+        topic_dir = os.path.join(directory, topic)
+        mtimes.append(os.stat(topic_dir).st_mtime_ns) # Taken before listing so a change made during the walk invalidates the index
+        filenames.append(sorted(entry.name for entry in os.scandir(topic_dir)))
+    return topics, filenames, mtimes
+
+def index_path(directory, cache_dir=None):
+    """ Returns where the index of a dataset directory (or archive) is cached, either inside the directory itself (or next to the archive) or in cache_dir """
+    if cache_dir is None and os.path.isfile(directory): return os.path.join(os.path.dirname(directory), '.%s.%s' % (os.path.basename(directory), INDEX_NAME[1:]))
+    if cache_dir is None: return os.path.join(directory, INDEX_NAME)
+    digest = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, 'corpus-index-%s.npz' % digest)
+
+def build_index(directory):
+    """ Builds the index of a dataset directory as compact arrays of topic names, concatenated filenames, per-topic offsets and folder modification times """
+    topics, filenames, mtimes = scan_corpus(directory)
+    return {'topics': np.array(topics, dtype=str),
+            'filenames': np.array([filename for topic_filenames in filenames for filename in topic_filenames], dtype=str),
+            'offsets': np.cumsum([0] + [len(topic_filenames) for topic_filenames in filenames]),
+            'mtimes': np.array(mtimes, dtype=np.int64)}
+
+def read_index(path):
+    """ Reads a cached index, returning None if there is no usable index at path """
+    try:
+        with np.load(path) as index:
+            return {key: index[key] for key in index.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+def write_index(path, index):
+    """ Writes an index (or any other dictionary of arrays cached alongside it) atomically so that concurrent runs never read a partially written file """
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **index)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print('Warning: could not write cache file "%s" (%s).' % (path, e))
+        if os.path.exists(temp_path): os.remove(temp_path)
+
+def index_is_current(directory, index):
+    """ Checks that the topic folders and their modification times still match those recorded in the index """
+    try:
+        topics = sorted(entry.name for entry in os.scandir(directory) if entry.is_dir() and not entry.name.startswith('.'))
+        if topics != index['topics'].tolist(): return False
+        mtimes = [os.stat(os.path.join(directory, topic)).st_mtime_ns for topic in topics]
+    except OSError:
+        return False
+    return mtimes == index['mtimes'].tolist()
+
+def load_corpus_index(directory, cache_dir=None):
+    """ Returns the topic names and an array of filepaths (documents) for each topic, reusing the cached index while no topic folder has changed.
+        directory can also be a tar or zip archive, in which case the filepaths point inside the archive and are read through the archive module """
+    archive = is_archive(directory)
+    is_current = archive_is_current if archive else index_is_current
+    key = (os.path.abspath(directory), cache_dir)
+    if key in loaded_indexes and is_current(directory, loaded_indexes[key][0]): return loaded_indexes[key][1]
+    path = index_path(directory, cache_dir)
+    index = read_index(path)
+    if index is None or not is_current(directory, index):
+        index = build_archive_index(directory) if archive else build_index(directory)
+        write_index(path, index)
+    topics = index['topics'].tolist()
+    offsets = index['offsets']
+    if archive:
+        register_archive(directory, index)
+        filepaths = [np.char.add(directory + '/', index['filenames'][offsets[topic_num]:offsets[topic_num + 1]]) for topic_num in range(len(topics))]
+    else:
+        filepaths = [np.char.add(os.path.join(directory, topic) + os.sep, index['filenames'][offsets[topic_num]:offsets[topic_num + 1]]) for topic_num, topic in enumerate(topics)]
+    loaded_indexes[key] = (index, (topics, filepaths))
+    return topics, filepaths
+
+def index_digest(directory, cache_dir=None):
+    """ Returns a digest of the current index of a dataset directory (or archive), which changes whenever the index has to be rebuilt.
+        Files cached alongside the index, such as the corpus term counts, are keyed by it """
+    load_corpus_index(directory, cache_dir)
+    index = loaded_indexes[(os.path.abspath(directory), cache_dir)][0]
+    digest = hashlib.sha1()
+    for key in sorted(index):
+        digest.update(key.encode('utf-8'))
+        digest.update(np.ascontiguousarray(index[key]).tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError: # Not available on Windows, peak RSS is then left out
+    resource = None
+
+class Stats():
+    """ Collects the timings and counters of a generation run and passes each event on to any registered callbacks.
+        A callback is called as callback(event, details) where details is a dictionary, e.g. ('window', {'window': 3, 'seconds': 0.01, 'documents': 100}) """
+
+    def __init__(self, callbacks=()):
+        self.callbacks = list(callbacks)
+        self.phases = Counter()
+        self.counts = Counter()
+        self.windows = []
+        self.output = {'files': 0, 'bytes': 0, 'seconds': 0.0}
+
+    def add_callback(self, callback):
+        """ Registers a callback which is called with every event """
+        self.callbacks.append(callback)
+
+    def emit(self, event, details):
+        """ Passes an event on to the registered callbacks """
+        for callback in self.callbacks:
+            callback(event, details)
+
+    def count(self, name, amount=1):
+        """ Increases a counter without emitting an event, for counters updated inside the sampling loop """
+        self.counts[name] += amount
+
+    def event(self, name, **details):
+        """ Counts an event and emits it """
+        self.counts[name] += 1
+        self.emit(name, details)
+
+    @contextmanager
+    def phase(self, name):
+        """ Times a phase of the run, such as indexing, sampling, saving or writing the overview """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phases[name] += seconds
+            self.emit('phase', {'name': name, 'seconds': seconds})
+
+    def window(self, window_num, seconds, num_docs):
+        """ Records how long a time window took to sample and how many documents it holds """
+        self.windows.append({'window': window_num, 'seconds': seconds, 'documents': num_docs})
+        self.counts['documents_sampled'] += num_docs
+        self.emit('window', self.windows[-1])
+
+    def record_output(self, num_files, num_bytes, seconds):
+        """ Records the files and bytes written when saving the dataset """
+        self.output['files'] += num_files
+        self.output['bytes'] += num_bytes
+        self.output['seconds'] += seconds
+        self.emit('output', {'files': num_files, 'bytes': num_bytes, 'seconds': seconds})
+
+    def peak_rss(self):
+        """ Returns the peak resident set size of the process in bytes, or None where it cannot be measured """
+        if resource is None: return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024 # Reported in kilobytes on Linux, bytes on macOS
+
+    def to_dict(self):
+        """ Returns all collected statistics as a dictionary """
+        return {'phases': dict(self.phases), 'counts': dict(self.counts), 'output': dict(self.output), 'peak_rss': self.peak_rss(), 'windows': self.windows}
+
+    def save(self, filepath):
+        """ Writes all collected statistics to a json file """
+        with open(filepath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
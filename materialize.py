@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from archive import is_archive, find_archive, iter_documents
+
+OUTPUT_MODES = ['copy', 'hardlink', 'symlink', 'manifest', 'packed']
+MANIFEST_NAME = 'manifest.csv'
+LINK_MODES = ['hardlink', 'symlink'] # Only regular files can be linked, documents inside an archive have to be copied out of it
+
+def supports_output_mode(input_path, output_mode):
+    """ Checks whether the documents of a dataset directory (or archive) can be stored with an output mode """
+    return output_mode not in LINK_MODES or input_path is None or not is_archive(input_path)
+
+def write_manifest(output_path, fieldnames, rows):
+    """ Writes one row per sampled filepath (document) into a csv manifest instead of copying the documents, appending to the manifest if it already exists.
+        Returns the number of files, the number of bytes and the number of seconds taken """
+    start = time.time()
+    with open(os.path.join(output_path, MANIFEST_NAME), 'a', newline='') as f:
+        size = f.tell()
+        writer = csv.writer(f)
+        if size == 0: writer.writerow(fieldnames)
+        writer.writerows(rows)
+        return (1 if size == 0 else 0), f.tell() - size, time.time() - start
+
+def read_manifest(output_path):
+    """ Reads a csv manifest back into a list of dictionaries keyed by the column names """
+    with open(os.path.join(output_path, MANIFEST_NAME), newline='') as f:
+        return list(csv.DictReader(f))
+
+def copy_file(source, target):
+    """ Copies a file and its permission bits, copying the data inside the kernel with copy_file_range or sendfile where supported
+        and falling back to a buffered copy for whatever they did not copy """
+    with open(source, 'rb') as fsrc, open(target, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        for kernel_copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+            if kernel_copy is None or copied == size: continue
+            try:
+                if kernel_copy is os.sendfile: fdst.seek(copied) # sendfile writes at the current position of the target
+                while copied < size:
+                    if kernel_copy is os.sendfile: sent = os.sendfile(fdst.fileno(), fsrc.fileno(), copied, size - copied)
+                    else: sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied, copied, copied)
+                    if sent == 0: break # Nothing more could be copied this way, carry on with the next method
+                    copied += sent
+            except OSError: # Not supported between these filesystems, carry on from where the copy stopped
+                continue
+        if copied < size:
+            fsrc.seek(copied)
+            fdst.seek(copied)
+            shutil.copyfileobj(fsrc, fdst)
+            copied = fdst.tell()
+        if copied != size: raise OSError('Copied %d of %d bytes of "%s"' % (copied, size, source))
+    shutil.copymode(source, target)
+    return size
+
+def materialize_file(filepath, topic_dir, output_mode):
+    """ Places a filepath (document) into a topic directory by copying it, hard linking it or symbolically linking it and returns its size in bytes """
+    target = os.path.join(topic_dir, os.path.basename(filepath))
+    if output_mode == 'copy': return copy_file(filepath, target)
+    elif output_mode == 'hardlink': os.link(filepath, target)
+    elif output_mode == 'symlink': os.symlink(os.path.abspath(filepath), target)
+    else: raise ValueError('Unknown output mode "%s"' % output_mode)
+    return os.path.getsize(filepath)
+
+def materialize_files(placements, output_mode, num_threads=8):
+    """ Creates every topic directory up front and then places all (filepath, topic_dir) pairs using a bounded pool of threads.
+        Returns the number of files, the number of bytes and the number of seconds taken """
+    start = time.time()
+    for topic_dir in sorted(set(topic_dir for filepath, topic_dir in placements)):
+        os.makedirs(topic_dir, exist_ok=True)
+    if placements and find_archive(placements[0][0])[0] is not None: # Documents read from an archive can only be copied out of it
+        if output_mode != 'copy': raise ValueError('Documents inside an archive cannot be stored with output mode "%s"' % output_mode)
+        sizes = [write_document(document, placements[position][1], placements[position][0]) for position, document in iter_documents([filepath for filepath, topic_dir in placements], num_threads)]
+        return len(placements), sum(sizes), time.time() - start
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        sizes = list(executor.map(lambda placement: materialize_file(placement[0], placement[1], output_mode), placements))
+    return len(placements), sum(sizes), time.time() - start
+
+def write_document(document, topic_dir, filepath):
+    """ Writes the bytes of a filepath (document) read from an archive into a topic directory and returns its size in bytes """
+    with open(os.path.join(topic_dir, os.path.basename(filepath)), 'wb') as f:
+        f.write(document)
+    return len(document)
+
+def report_throughput(num_files, num_bytes, seconds):
+    """ Prints how many files and bytes were written and the rate at which they were written """
+    seconds = max(seconds, 1e-9)
+    print("Saved %d files (%.1f MB) in %.2f seconds: %.0f files/s, %.1f MB/s" % (num_files, num_bytes / 1e6, seconds, num_files / seconds, num_bytes / 1e6 / seconds))
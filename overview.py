@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+
+def count_topics(time_windows, topics):
+    """ Counts the filepaths (documents) of each topic in every time window as a windows x topics matrix """
+    topic_index = {topic: topic_num for topic_num, topic in enumerate(topics)}
+    counts = np.zeros((len(time_windows), len(topics)), dtype=int)
+    for window_num, cur_window in enumerate(time_windows):
+        topic_nums = [topic_index[os.path.basename(os.path.dirname(doc))] for doc in cur_window]
+        counts[window_num] = np.bincount(topic_nums, minlength=len(topics))
+    return counts
+
+def write_overview(filepath, counts, columns=()):
+    """ Writes the number of topics, the number of documents, any extra (name, values) columns and the proportion of each topic for every time window as a csv file """
+    num_topics = (counts > 0).sum(axis=1)
+    num_docs = counts.sum(axis=1)
+    proportions = counts / np.maximum(num_docs, 1)[:, np.newaxis]
+    with open(filepath, 'w') as f:
+        heading = ['Num Topics', 'Num Docs'] + [name for name, values in columns]
+        for i in range(1, counts.shape[1]+1):
+            heading.append('Topic %s ' % i)
+        f.write(','.join(heading)+'\n')
+        for i in range(len(counts)):
+            distribution = ["%.3f" % proportion if count > 0 else '0.0' for count, proportion in zip(counts[i], proportions[i])]
+            f.write(','.join([str(num_topics[i]), str(num_docs[i])] + [str(values[i]) for name, values in columns] + distribution) + '\n')
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+from archive import document_size, iter_documents
+
+BLOB_NAME = 'stream.bin'
+
+def append_packed(output_path, time_windows, num_threads=8):
+    """ Appends the documents of the given time windows to the end of the blob and returns the size of each document """
+    filepaths = [filepath for cur_window in time_windows for filepath in cur_window]
+    sizes = np.array([document_size(filepath) for filepath in filepaths], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    blob_path = os.path.join(output_path, BLOB_NAME)
+    with open(blob_path, 'r+b' if os.path.exists(blob_path) else 'wb') as blob:
+        start = blob.seek(0, os.SEEK_END)
+        blob.truncate(start + offsets[-1])
+        for doc_num, document in iter_documents(filepaths, num_threads): # Documents may arrive in any order, each is written at its own offset
+            blob.seek(start + offsets[doc_num])
+            blob.write(document)
+    return sizes
+
+def write_packed_index(output_path, time_windows, topics, drift=None):
+    """ Writes the NumPy arrays of document offsets, topic labels, window offsets, topic names and drift flags which describe the blob """
+    topic_index = {topic: topic_num for topic_num, topic in enumerate(topics)}
+    filepaths = [filepath for cur_window in time_windows for filepath in cur_window]
+    sizes = np.array([document_size(filepath) for filepath in filepaths], dtype=np.int64)
+    np.save(os.path.join(output_path, 'offsets.npy'), np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64))
+    np.save(os.path.join(output_path, 'labels.npy'), np.array([topic_index[os.path.basename(os.path.dirname(doc))] for doc in filepaths], dtype=np.int32))
+    np.save(os.path.join(output_path, 'window_offsets.npy'), np.concatenate([[0], np.cumsum([len(cur_window) for cur_window in time_windows])]).astype(np.int64))
+    np.save(os.path.join(output_path, 'topics.npy'), np.array(topics, dtype=str))
+    if drift is not None: np.save(os.path.join(output_path, 'drift.npy'), np.array(drift, dtype=bool))
+
+class PackedStream():
+    """ Memory-maps a packed stream so that any time window or document can be accessed without copying it """
+
+    def __init__(self, path):
+        blob_path = os.path.join(path, BLOB_NAME)
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if os.path.getsize(blob_path) > 0 else np.zeros(0, dtype=np.uint8)
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+        self.window_offsets = np.load(os.path.join(path, 'window_offsets.npy'), mmap_mode='r')
+        self.topics = np.load(os.path.join(path, 'topics.npy')).tolist()
+        drift_path = os.path.join(path, 'drift.npy')
+        self.drift = np.load(drift_path) if os.path.exists(drift_path) else None
+
+    def __len__(self):
+        return len(self.window_offsets) - 1
+
+    def num_documents(self):
+        """ Returns the number of documents in the whole stream """
+        return len(self.offsets) - 1
+
+    def document(self, doc_num):
+        """ Returns a zero-copy view of the bytes of a document """
+        return memoryview(self.blob[self.offsets[doc_num]:self.offsets[doc_num + 1]])
+
+    def text(self, doc_num, encoding='utf-8'):
+        """ Returns the decoded text of a document """
+        return bytes(self.document(doc_num)).decode(encoding, errors='replace')
+
+    def window(self, window_num):
+        """ Returns zero-copy views of the documents of a time window (numbered from 0) and their topic labels """
+        start, end = self.window_offsets[window_num], self.window_offsets[window_num + 1]
+        return [self.document(doc_num) for doc_num in range(start, end)], self.labels[start:end]
+
+    def __getitem__(self, window_num):
+        return self.window(window_num)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import os
+import queue
+import importlib
+import threading
+from collections import namedtuple
+from archive import iter_documents
+
+Window = namedtuple('Window', ['number', 'filepaths', 'labels', 'drift', 'texts'])
+
+def load_generators():
+    """ Imports the ConceptShift and ConceptDrift classes from the concept-shift.py and concept-drift.py scripts """
+    return importlib.import_module('concept-shift').ConceptShift, importlib.import_module('concept-drift').ConceptDrift
+
+def read_documents(filepaths, encoding='utf-8'):
+    """ Reads the text of each filepath (document), which may be inside an archive """
+    texts = [None] * len(filepaths)
+    for position, document in iter_documents(filepaths):
+        texts[position] = document.decode(encoding, errors='replace')
+    return texts
+
+def generate_windows(gen, load_text=False, encoding='utf-8'):
+    """ Yields each time window of a generator with its topic labels, its drift flag (None for concept shift) and optionally the text of its documents """
+    for window_num, cur_window in enumerate(gen.iter_windows(keep_windows=False)):
+        labels = [os.path.basename(os.path.dirname(doc)) for doc in cur_window]
+        drift = gen.drift_list[-1] if hasattr(gen, 'drift_list') else None
+        texts = read_documents(cur_window, encoding) if load_text else None
+        yield Window(window_num + 1, cur_window, labels, drift, texts)
+
+def prefetch_windows(windows, depth=1):
+    """ Produces windows on a background thread, keeping at most depth windows ready ahead of the consumer """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    finished = object()
+
+    def produce():
+        try:
+            for window in windows:
+                while not stop.is_set():
+                    try:
+                        ready.put(window, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set(): return
+            ready.put(finished)
+        except Exception as e: # Raised again on the consumer's thread
+            ready.put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            window = ready.get()
+            if window is finished: return
+            if isinstance(window, Exception): raise window
+            yield window
+    finally:
+        stop.set()
+
+def stream_windows(gen, load_text=False, prefetch=False, encoding='utf-8'):
+    """ Lazily yields the time windows of a ConceptShift or ConceptDrift generator without writing anything to disk.
+        With prefetch=True the next window is sampled and its documents read on a background thread while the current one is consumed,
+        so the generator must not be used directly until the stream is exhausted or closed """
+    windows = generate_windows(gen, load_text, encoding)
+    return prefetch_windows(windows) if prefetch else windows
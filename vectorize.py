@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+from collections import Counter
+import numpy as np
+from archive import iter_documents
+from corpus_index import load_corpus_index, index_path, index_digest, read_index, write_index
+try:
+    import scipy.sparse as sparse
+except ImportError: # Only needed to turn the matrices into scipy sparse matrices, everything else uses plain NumPy arrays
+    sparse = None
+
+TOKEN_PATTERN = re.compile(r'\b\w\w+\b') # Words of two or more characters, as in scikit-learn's CountVectorizer
+VECTORS_FOLDER = 'vectors'
+loaded_vectors = {} # Vectors already loaded by this process, which child processes inherit when forked
+
+def vectors_path(directory, cache_dir=None):
+    """ Returns where the term counts of a dataset directory (or archive) are cached, next to its corpus index """
+    path = index_path(directory, cache_dir)
+    return os.path.join(os.path.dirname(path), os.path.basename(path).replace('corpus-index', 'corpus-vectors'))
+
+def tokenize(document, encoding='utf-8'):
+    """ Splits the bytes of a document into lowercase tokens """
+    return TOKEN_PATTERN.findall(document.decode(encoding, errors='replace').lower())
+
+def build_vectors(filepaths, num_threads=8, encoding='utf-8'):
+    """ Tokenizes every filepath (document) once and returns the sorted vocabulary and a CSR documents x terms count matrix as (data, indices, indptr) arrays,
+        with one row per document in the order of filepaths """
+    vocabulary = {}
+    rows, columns, counts = ([] for i in range(3))
+    for position, document in iter_documents(filepaths, num_threads): # Documents may arrive in any order, the rows are put in order below
+        token_counts = Counter(tokenize(document, encoding))
+        columns.append(np.array([vocabulary.setdefault(token, len(vocabulary)) for token in token_counts], dtype=np.int32))
+        counts.append(np.array(list(token_counts.values()), dtype=np.int32))
+        rows.append(np.full(len(token_counts), position, dtype=np.int64))
+    terms = sorted(vocabulary)
+    term_order = np.empty(len(terms), dtype=np.int32)
+    term_order[[vocabulary[term] for term in terms]] = np.arange(len(terms), dtype=np.int32) # Terms are numbered in sorted order so the vocabulary is the same on every run
+    rows, columns, counts = (np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype) for arrays, dtype in ((rows, np.int64), (columns, np.int32), (counts, np.int32)))
+    columns = term_order[columns]
+    order = np.lexsort((columns, rows))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(filepaths)))]).astype(np.int64)
+    return np.array(terms, dtype=str), counts[order], columns[order], indptr
+
+class CorpusVectors():
+    """ The cached term counts of every document in a corpus, from which the count matrix of any time window is gathered without reading any text """
+
+    def __init__(self, topics, filepaths, vectors):
+        self.topics = topics
+        self.filepaths = filepaths
+        self.topic_index = {topic: topic_num for topic_num, topic in enumerate(topics)}
+        self.topic_offsets = np.cumsum([0] + [len(topic_filepaths) for topic_filepaths in filepaths])
+        self.vocabulary = vectors['vocabulary']
+        self.data, self.indices, self.indptr = vectors['data'], vectors['indices'], vectors['indptr']
+
+    def rows(self, filepaths):
+        """ Returns the matrix row and topic number of each filepath (document). Filepaths are sorted within each topic, so each row is found by binary search.
+            Raises a KeyError for a filepath which is not in the corpus index """
+        topic_nums = np.array([self.topic_index[os.path.basename(os.path.dirname(doc))] for doc in filepaths], dtype=np.int32)
+        rows = np.empty(len(filepaths), dtype=np.int64)
+        for position, (topic_num, doc) in enumerate(zip(topic_nums, filepaths)):
+            topic_filepaths = self.filepaths[topic_num]
+            row = np.searchsorted(topic_filepaths, doc)
+            if row == len(topic_filepaths) or topic_filepaths[row] != doc: raise KeyError('"%s" is not in the corpus index' % doc)
+            rows[position] = self.topic_offsets[topic_num] + row
+        return rows, topic_nums
+
+    def gather(self, filepaths):
+        """ Gathers the rows of the given filepaths (documents) into a new CSR matrix, returned as (data, indices, indptr) arrays together with the topic labels """
+        rows, labels = self.rows(filepaths)
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        positions = np.repeat(self.indptr[rows] - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return (self.data[positions], self.indices[positions], indptr), labels
+
+    def matrix(self, filepaths):
+        """ Returns the term counts of the given filepaths (documents) as a scipy sparse matrix, together with the topic labels """
+        if sparse is None: raise ImportError('scipy is required to create sparse matrices, use gather() for the plain CSR arrays')
+        (data, indices, indptr), labels = self.gather(filepaths)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(filepaths), len(self.vocabulary))), labels
+
+def load_vectors(directory, cache_dir=None, num_threads=8, encoding='utf-8'):
+    """ Returns the term counts of every document in a dataset directory (or archive), tokenizing the corpus only when its corpus index has changed
+        since the counts were cached """
+    key = (os.path.abspath(directory), cache_dir)
+    topics, filepaths = load_corpus_index(directory, cache_dir)
+    digest = index_digest(directory, cache_dir)
+    if key in loaded_vectors and loaded_vectors[key][0] == digest: return loaded_vectors[key][1]
+    path = vectors_path(directory, cache_dir)
+    vectors = read_index(path)
+    if vectors is None or vectors.get('digest', np.array('')).item() != digest:
+        print('Tokenizing corpus...')
+        vocabulary, data, indices, indptr = build_vectors([doc for topic_filepaths in filepaths for doc in topic_filepaths.tolist()], num_threads, encoding)
+        vectors = {'vocabulary': vocabulary, 'data': data, 'indices': indices, 'indptr': indptr, 'digest': np.array(digest)}
+        write_index(path, vectors)
+    loaded_vectors[key] = (digest, CorpusVectors(topics, filepaths, vectors))
+    return loaded_vectors[key][1]
+
+def write_window_vectors(output_path, time_windows, vectors):
+    """ Writes the term counts of each time window as a CSR matrix in its own .npz file, readable with scipy.sparse.load_npz, with the topic number
+        of each row stored under 'labels'. The vocabulary and topic names are stored alongside """
+    folder = os.path.join(output_path, VECTORS_FOLDER)
+    if not os.path.exists(folder): os.mkdir(folder)
+    np.save(os.path.join(folder, 'vocabulary.npy'), vectors.vocabulary)
+    np.save(os.path.join(folder, 'topics.npy'), np.array(vectors.topics, dtype=str))
+    for window_num, cur_window in enumerate(time_windows):
+        (data, indices, indptr), labels = vectors.gather(cur_window)
+        np.savez(os.path.join(folder, 'window-%04d.npz' % (window_num + 1)), data=data, indices=indices, indptr=indptr, format=np.array('csr'),
+                 shape=np.array([len(cur_window), len(vectors.vocabulary)]), labels=labels)